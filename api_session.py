@@ -0,0 +1,40 @@
+# Cached API key and HTTP session, kept in their own module so the cache keys
+# (module + function name) are the same whether they are reached from the
+# script, which Streamlit runs as __main__, or from app.py's startup lifespan.
+import streamlit as st
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Get API key from Supabase secrets
+@st.cache_resource(show_spinner=False)
+def get_api_key():
+    try:
+        # Try to get from Streamlit secrets (Supabase secrets)
+        return st.secrets["whoisjson"]["api_key"]
+    except Exception as e:
+        st.error(f"Error loading API key from secrets: {e}")
+        return None
+
+# Shared HTTP session so connections are kept alive across lookups and reruns.
+# The pool is sized for the batch thread pool and transient 5xx errors are
+# retried with short capped backoff, ignoring Retry-After so a worker can't
+# stall. Rate limits (429) aren't retried, so they reach HTTPError straight
+# away instead of re-hitting an API that asked the app to back off. Once retries
+# run out the last response is returned, so raise_for_status() still raises.
+@st.cache_resource(show_spinner=False)
+def get_session():
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.2,
+        backoff_max=2,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=("GET",),
+        raise_on_status=False,
+        respect_retry_after_header=False
+    )
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=retry)
+    session.mount("https://", adapter)
+    session.headers.update({"Authorization": f"Token={get_api_key()}"})
+    return session
@@ -0,0 +1,16 @@
+from contextlib import asynccontextmanager
+
+from streamlit.starlette import App
+
+
+# Build the cached API key and HTTP session before the first request so the
+# first user doesn't pay for their construction. They are imported from
+# api_session, not streamlit_app, so the cache entries are the ones the
+# script reads.
+@asynccontextmanager
+async def lifespan(app):
+    from api_session import get_session
+    get_session()
+    yield
+
+app = App("streamlit_app.py", lifespan=lifespan)
@@ -1,7 +1,48 @@
 import streamlit as st
+import pandas as pd
 import requests
 import json
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from api_session import get_api_key, get_session
+
+# Prefer orjson for (de)serialization when it's installed
+try:
+    import orjson
+
+    def _dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+
+    def _loads(data):
+        return orjson.loads(data)
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj, indent=2).encode()
+
+    def _loads(data):
+        return json.loads(data)
+
+# Widget options, built once instead of on every rerun
+OPERATIONS = ("WHOIS Lookup", "DNS Lookup (nslookup)", "SSL Certificate Check", "Batch Operations")
+RECORD_TYPES = ("All Records", "A", "MX", "TXT", "CNAME", "NS", "PTR", "AAAA", "SOA")
+BATCH_OPERATIONS = ("WHOIS Lookup", "DNS Lookup", "SSL Certificate Check")
+BATCH_PLACEHOLDER = "example.com\ngoogle.com\ngithub.com"
+
+# Cheap sanity check for batch input, so bad lines don't use API quota
+DOMAIN_RE = re.compile(r"^[a-z0-9.-]+\.(?:[a-z]{2,}|xn--[a-z0-9-]+)$")
+SCHEME_RE = re.compile(r"^https?://")
+
+# Value types shown as nested JSON rather than table rows
+NESTED_TYPES = frozenset((dict, list))
+
+# (connect, read) timeout in seconds for every API request
+REQUEST_TIMEOUT = (5, 30)
+
+# Batches larger than this only render their JSON when explicitly requested
+BATCH_JSON_PREVIEW_LIMIT = 50
 
 # Page config
 st.set_page_config(
@@ -10,75 +51,181 @@ st.set_page_config(
     layout="wide"
 )
 
-# Initialize session state
-if 'api_key' not in st.session_state:
-    st.session_state.api_key = None
+# Passed as _prefetched to whois_lookup() to only read its cache: a miss raises
+# _NotCached instead of fetching, and exceptions are never cached
+_CACHED_ONLY = object()
 
-# Get API key from Supabase secrets
-@st.cache_resource
-def get_api_key():
-    try:
-        # Try to get from Streamlit secrets (Supabase secrets)
-        return st.secrets["whoisjson"]["api_key"]
-    except Exception as e:
-        st.error(f"Error loading API key from secrets: {e}")
-        return None
+class _NotCached(Exception):
+    pass
 
 # API helper functions
-def whois_lookup(domain, api_key):
+# Results are cached per domain (and record type) so reruns and repeated
+# lookups skip the round trip.
+@st.cache_data(ttl=24 * 60 * 60, max_entries=512, show_spinner=False)
+def whois_lookup(domain, _prefetched=None):
     """Perform WHOIS lookup"""
+    # _prefetched isn't hashed: it seeds the cache with a batched result
+    if _prefetched is _CACHED_ONLY:
+        raise _NotCached(domain)
+    if _prefetched is not None:
+        return _prefetched
+    
     url = "https://whoisjson.com/api/v1/whois"
     params = {"domain": domain}
-    headers = {"Authorization": f"Token={api_key}"}
     
-    response = requests.get(url, params=params, headers=headers)
+    response = get_session().get(url, params=params, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()
-    return response.json()
+    return _loads(response.content)
 
-def nslookup(domain, api_key, record_type=None):
+@st.cache_data(ttl=24 * 60 * 60, max_entries=512, show_spinner=False)
+def nslookup(domain, record_type=None):
     """Perform DNS lookup"""
     url = "https://whoisjson.com/api/v1/nslookup"
     params = {"domain": domain}
     if record_type and record_type != "All Records":
         params["type"] = record_type
-    headers = {"Authorization": f"Token={api_key}"}
     
-    response = requests.get(url, params=params, headers=headers)
+    response = get_session().get(url, params=params, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()
-    return response.json()
+    return _loads(response.content)
 
-def ssl_cert_check(domain, api_key):
+@st.cache_data(ttl=24 * 60 * 60, max_entries=512, show_spinner=False)
+def ssl_cert_check(domain):
     """Check SSL certificate"""
     url = "https://whoisjson.com/api/v1/ssl"
     params = {"domain": domain}
-    headers = {"Authorization": f"Token={api_key}"}
     
-    response = requests.get(url, params=params, headers=headers)
+    response = get_session().get(url, params=params, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()
-    return response.json()
+    return _loads(response.content)
+
+# Lookup function for each batch operation
+BATCH_LOOKUPS = {
+    "WHOIS Lookup": whois_lookup,
+    "DNS Lookup": nslookup,
+    "SSL Certificate Check": ssl_cert_check,
+}
+
+# The batch endpoint isn't part of the documented API, so it is only used when
+# enabled with `batch_endpoint = true` under [whoisjson] in the secrets
+def _batch_whois_enabled():
+    try:
+        return bool(st.secrets["whoisjson"].get("batch_endpoint", False))
+    except Exception:
+        return False
+
+# Batched WHOIS lookup in a single request; returns None when the endpoint
+# is unavailable or doesn't answer for every domain so callers can fall back
+def multi_whois(domains):
+    try:
+        response = get_session().post(
+            "https://whoisjson.com/api/v1/whois/batch",
+            json={"domains": domains},
+            timeout=REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
+        batched = _loads(response.content)
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+    if not isinstance(batched, dict) or not all(domain in batched for domain in domains):
+        return None
+    return batched
+
+# Normalize user input to a lowercase bare domain (no scheme or path), so single
+# and batch lookups share the same lookup cache entries
+def _normalize_domain(text):
+    return SCHEME_RE.sub("", text.strip().lower()).split("/")[0]
 
-# Helper function to display JSON results
-def display_result(result, title):
+# Normalize batch input lines, dropping duplicates (keeping first-seen order)
+# and returning invalid lines separately
+def _parse_domains(text):
+    seen = set()
+    domains = []
+    invalid = []
+    for line in text.splitlines():
+        domain = _normalize_domain(line)
+        if not domain or domain in seen:
+            continue
+        seen.add(domain)
+        if DOMAIN_RE.match(domain):
+            domains.append(domain)
+        else:
+            invalid.append(line.strip())
+    return domains, invalid
+
+# Helper function to display JSON results; data is the serialized result
+def display_result(result, title, data):
     st.subheader(title)
     if result:
         # Create expandable JSON view
         with st.expander("📄 View Raw JSON", expanded=False):
-            st.json(result)
+            st.code(data.decode(), language="json")
         
         # Display formatted data
         if isinstance(result, dict):
-            # Create a more organized display
-            for key, value in result.items():
-                if isinstance(value, dict):
-                    st.markdown(f"**{key}:**")
-                    for sub_key, sub_value in value.items():
-                        st.markdown(f"  - *{sub_key}:* {sub_value}")
-                elif isinstance(value, list):
-                    st.markdown(f"**{key}:**")
-                    for item in value:
-                        st.markdown(f"  - {item}")
-                else:
-                    st.markdown(f"**{key}:** {value}")
+            table, nested = _result_table(result)
+            if not table.empty:
+                st.dataframe(table, width="stretch", hide_index=True)
+            if nested:
+                with st.expander("🗂️ Nested fields", expanded=True):
+                    st.code(nested, language="json")
+
+# Split a result into a Field/Value table of scalars and one JSON block of nested values
+def _result_table(result):
+    rows = []
+    nested = {}
+    # Classify each value once by exact type; parsed JSON only yields plain dicts/lists
+    for key, value in result.items():
+        if type(value) in NESTED_TYPES:
+            nested[key] = value
+        else:
+            rows.append((key, str(value)))
+    table = pd.DataFrame(rows, columns=["Field", "Value"])
+    return table, _dumps(nested).decode() if nested else ""
+
+# Show certificate validity
+def _show_validity(result):
+    if isinstance(result, dict):
+        if 'valid_from' in result and 'valid_to' in result:
+            st.info(f"📅 Valid from: {result['valid_from']} to {result['valid_to']}")
+        elif 'notBefore' in result and 'notAfter' in result:
+            st.info(f"📅 Valid from: {result['notBefore']} to {result['notAfter']}")
+
+# Download button for a single serialized lookup result
+def _download_button(data, domain, file_prefix):
+    st.download_button(
+        label="📥 Download JSON",
+        data=data,
+        file_name=f"{file_prefix}_{domain}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+        mime="application/json"
+    )
+
+# Render a single-domain lookup page: input, optional extra inputs, button and result
+def render_lookup(operation, *, header, description, button_label, spinner_text, title,
+                  file_prefix, api_fn, extra_inputs=None, post_process=None):
+    st.header(header)
+    st.markdown(description)
+    
+    # Inputs only trigger a rerun when the form is submitted
+    with st.form(f"{operation}_form", clear_on_submit=False):
+        domain = _normalize_domain(st.text_input("Enter Domain Name:", placeholder="example.com"))
+        options = extra_inputs() if extra_inputs else {}
+        submitted = st.form_submit_button(button_label, type="primary")
+    
+    if submitted and domain:
+        with st.spinner(spinner_text.format(domain=domain)):
+            try:
+                result = api_fn(domain, **options)
+                # Serialize once for both the raw JSON view and the download
+                data = _dumps(result)
+                display_result(result, title.format(domain=domain), data)
+                if post_process:
+                    post_process(result)
+                _download_button(data, domain, file_prefix)
+            except requests.exceptions.HTTPError as e:
+                st.error(f"❌ HTTP Error: {e.response.status_code} - {e.response.text}")
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
 
 # Main app
 def main():
@@ -98,127 +245,78 @@ def main():
     st.sidebar.title("API Operations")
     operation = st.sidebar.radio(
         "Select Operation:",
-        ["WHOIS Lookup", "DNS Lookup (nslookup)", "SSL Certificate Check", "Batch Operations"]
+        OPERATIONS
     )
     
     # Main content area
     if operation == "WHOIS Lookup":
-        st.header("🌐 WHOIS Lookup")
-        st.markdown("Get detailed domain registration information")
-        
-        domain = st.text_input("Enter Domain Name:", placeholder="example.com")
-        
-        col1, col2 = st.columns([1, 4])
-        with col1:
-            lookup_btn = st.button("🔍 Lookup", type="primary", use_container_width=True)
-        
-        if lookup_btn and domain:
-            with st.spinner(f"Fetching WHOIS data for {domain}..."):
-                try:
-                    result = whois_lookup(domain, api_key)
-                    display_result(result, f"WHOIS Information for {domain}")
-                    
-                    # Download button
-                    st.download_button(
-                        label="📥 Download JSON",
-                        data=json.dumps(result, indent=2),
-                        file_name=f"whois_{domain}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                        mime="application/json"
-                    )
-                except requests.exceptions.HTTPError as e:
-                    st.error(f"❌ HTTP Error: {e.response.status_code} - {e.response.text}")
-                except Exception as e:
-                    st.error(f"❌ Error: {str(e)}")
+        render_lookup(
+            operation,
+            header="🌐 WHOIS Lookup",
+            description="Get detailed domain registration information",
+            button_label="🔍 Lookup",
+            spinner_text="Fetching WHOIS data for {domain}...",
+            title="WHOIS Information for {domain}",
+            file_prefix="whois",
+            api_fn=whois_lookup
+        )
     
     elif operation == "DNS Lookup (nslookup)":
-        st.header("🔎 DNS Lookup")
-        st.markdown("Query DNS records for a domain")
-        
-        domain = st.text_input("Enter Domain Name:", placeholder="example.com")
-        
-        record_type = st.selectbox(
-            "Select Record Type (optional):",
-            ["All Records", "A", "MX", "TXT", "CNAME", "NS", "PTR", "AAAA", "SOA"]
+        render_lookup(
+            operation,
+            header="🔎 DNS Lookup",
+            description="Query DNS records for a domain",
+            button_label="🔍 Lookup",
+            spinner_text="Fetching DNS records for {domain}...",
+            title="DNS Records for {domain}",
+            file_prefix="dns",
+            api_fn=nslookup,
+            extra_inputs=lambda: {"record_type": st.selectbox(
+                "Select Record Type (optional):",
+                RECORD_TYPES
+            )}
         )
-        
-        col1, col2 = st.columns([1, 4])
-        with col1:
-            lookup_btn = st.button("🔍 Lookup", type="primary", use_container_width=True)
-        
-        if lookup_btn and domain:
-            with st.spinner(f"Fetching DNS records for {domain}..."):
-                try:
-                    result = nslookup(domain, api_key, record_type)
-                    display_result(result, f"DNS Records for {domain}")
-                    
-                    # Download button
-                    st.download_button(
-                        label="📥 Download JSON",
-                        data=json.dumps(result, indent=2),
-                        file_name=f"dns_{domain}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                        mime="application/json"
-                    )
-                except requests.exceptions.HTTPError as e:
-                    st.error(f"❌ HTTP Error: {e.response.status_code} - {e.response.text}")
-                except Exception as e:
-                    st.error(f"❌ Error: {str(e)}")
     
     elif operation == "SSL Certificate Check":
-        st.header("🔒 SSL Certificate Check")
-        st.markdown("Verify SSL/TLS certificate information")
-        
-        domain = st.text_input("Enter Domain Name:", placeholder="example.com")
-        
-        col1, col2 = st.columns([1, 4])
-        with col1:
-            check_btn = st.button("🔍 Check", type="primary", use_container_width=True)
-        
-        if check_btn and domain:
-            with st.spinner(f"Checking SSL certificate for {domain}..."):
-                try:
-                    result = ssl_cert_check(domain, api_key)
-                    display_result(result, f"SSL Certificate for {domain}")
-                    
-                    # Show certificate validity
-                    if isinstance(result, dict):
-                        if 'valid_from' in result and 'valid_to' in result:
-                            st.info(f"📅 Valid from: {result['valid_from']} to {result['valid_to']}")
-                        elif 'notBefore' in result and 'notAfter' in result:
-                            st.info(f"📅 Valid from: {result['notBefore']} to {result['notAfter']}")
-                    
-                    # Download button
-                    st.download_button(
-                        label="📥 Download JSON",
-                        data=json.dumps(result, indent=2),
-                        file_name=f"ssl_{domain}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                        mime="application/json"
-                    )
-                except requests.exceptions.HTTPError as e:
-                    st.error(f"❌ HTTP Error: {e.response.status_code} - {e.response.text}")
-                except Exception as e:
-                    st.error(f"❌ Error: {str(e)}")
+        render_lookup(
+            operation,
+            header="🔒 SSL Certificate Check",
+            description="Verify SSL/TLS certificate information",
+            button_label="🔍 Check",
+            spinner_text="Checking SSL certificate for {domain}...",
+            title="SSL Certificate for {domain}",
+            file_prefix="ssl",
+            api_fn=ssl_cert_check,
+            post_process=_show_validity
+        )
     
     elif operation == "Batch Operations":
         st.header("📦 Batch Operations")
         st.markdown("Perform lookups on multiple domains")
         
-        domains_input = st.text_area(
-            "Enter Domain Names (one per line):",
-            placeholder="example.com\ngoogle.com\ngithub.com",
-            height=150
-        )
-        
-        batch_operation = st.selectbox(
-            "Select Operation:",
-            ["WHOIS Lookup", "DNS Lookup", "SSL Certificate Check"]
-        )
-        
-        col1, col2 = st.columns([1, 4])
-        with col1:
-            batch_btn = st.button("🚀 Run Batch", type="primary", use_container_width=True)
+        with st.form(f"{operation}_form", clear_on_submit=False):
+            domains_input = st.text_area(
+                "Enter Domain Names (one per line):",
+                placeholder=BATCH_PLACEHOLDER,
+                height=150
+            )
+            
+            batch_operation = st.selectbox(
+                "Select Operation:",
+                BATCH_OPERATIONS
+            )
+            
+            show_full_json = st.checkbox(
+                f"Show full JSON for batches over {BATCH_JSON_PREVIEW_LIMIT} domains"
+            )
+            
+            batch_btn = st.form_submit_button("🚀 Run Batch", type="primary")
         
         if batch_btn and domains_input:
-            domains = [d.strip() for d in domains_input.split('\n') if d.strip()]
+            domains, invalid = _parse_domains(domains_input)
+            
+            if invalid:
+                st.warning(f"Skipping invalid domains: {', '.join(invalid)}")
             
             if not domains:
                 st.warning("Please enter at least one domain")
@@ -226,52 +324,101 @@ def main():
             
             st.info(f"Processing {len(domains)} domains...")
             
-            results = {}
+            results = dict.fromkeys(domains)
+            successful = failed = 0
             progress_bar = st.progress(0)
-            status_container = st.container()
+            status = st.empty()
+            failures = []
+            
+            lookup_fn = BATCH_LOOKUPS[batch_operation]
+            
+            pending = domains
+            if batch_operation == "WHOIS Lookup" and _batch_whois_enabled():
+                # Serve cached domains first, then send the rest in one batched request
+                pending = []
+                for domain in domains:
+                    try:
+                        results[domain] = whois_lookup(domain, _prefetched=_CACHED_ONLY)
+                        successful += 1
+                    except _NotCached:
+                        pending.append(domain)
+                
+                batched = multi_whois(pending) if pending else None
+                if batched is not None:
+                    for domain in pending:
+                        entry = batched[domain]
+                        if isinstance(entry, dict) and "error" in entry:
+                            failures.append(f"❌ Failed: {domain} - {entry['error']}")
+                            results[domain] = entry
+                            failed += 1
+                        else:
+                            results[domain] = whois_lookup(domain, _prefetched=entry)
+                            successful += 1
+                    pending = []
+                progress_bar.progress((len(domains) - len(pending)) / len(domains))
             
-            for idx, domain in enumerate(domains):
+            # Fall back to one lookup per domain for anything not answered above
+            if pending:
+                done = len(domains) - len(pending)
+                # Lookups are I/O-bound, so run them concurrently over the shared session.
+                # The session is built on the script thread and this run's context is
+                # attached to the workers, so the cached helpers they call have one.
+                get_session()
+                executor = ThreadPoolExecutor(
+                    max_workers=min(16, len(pending)),
+                    initializer=add_script_run_ctx,
+                    initargs=(None, get_script_run_ctx())
+                )
                 try:
-                    if batch_operation == "WHOIS Lookup":
-                        results[domain] = whois_lookup(domain, api_key)
-                    elif batch_operation == "DNS Lookup":
-                        results[domain] = nslookup(domain, api_key)
-                    elif batch_operation == "SSL Certificate Check":
-                        results[domain] = ssl_cert_check(domain, api_key)
+                    futures = {executor.submit(lookup_fn, domain): domain for domain in pending}
                     
-                    with status_container:
-                        st.success(f"✅ Completed: {domain}")
-                except requests.exceptions.HTTPError as e:
-                    with status_container:
-                        st.error(f"❌ Failed: {domain} - HTTP {e.response.status_code}")
-                    results[domain] = {"error": f"HTTP {e.response.status_code}: {e.response.text}"}
-                except Exception as e:
-                    with status_container:
-                        st.error(f"❌ Failed: {domain} - {str(e)}")
-                    results[domain] = {"error": str(e)}
-                
-                progress_bar.progress((idx + 1) / len(domains))
+                    for idx, future in enumerate(as_completed(futures)):
+                        domain = futures[future]
+                        try:
+                            results[domain] = future.result()
+                            successful += 1
+                            
+                            status.write(f"✅ {done + idx + 1}/{len(domains)}: {domain}")
+                        except requests.exceptions.HTTPError as e:
+                            failures.append(f"❌ Failed: {domain} - HTTP {e.response.status_code}")
+                            results[domain] = {"error": f"HTTP {e.response.status_code}: {e.response.text}"}
+                            failed += 1
+                        except Exception as e:
+                            failures.append(f"❌ Failed: {domain} - {str(e)}")
+                            results[domain] = {"error": str(e)}
+                            failed += 1
+                        
+                        progress_bar.progress((done + idx + 1) / len(domains))
+                finally:
+                    # A rerun interrupts this loop with an exception; drop the queued
+                    # lookups instead of waiting for them so they don't use API quota
+                    executor.shutdown(wait=False, cancel_futures=True)
+            
+            status.empty()
+            if failures:
+                st.error("\n\n".join(failures))
             
             st.success(f"🎉 Batch operation completed! Processed {len(domains)} domains")
             
             # Display summary
-            successful = sum(1 for r in results.values() if "error" not in r)
-            failed = len(domains) - successful
-            
             col1, col2 = st.columns(2)
             with col1:
                 st.metric("Successful", successful, delta=None)
             with col2:
                 st.metric("Failed", failed, delta=None)
             
+            # Serialize once for both the results view and the download
+            data = _dumps(results)
+            
             # Display all results
-            with st.expander("📊 View All Results", expanded=True):
-                st.json(results)
+            if len(domains) <= BATCH_JSON_PREVIEW_LIMIT or show_full_json:
+                with st.expander("📊 View All Results", expanded=True):
+                    st.code(data.decode(), language="json")
             
             # Download button for batch results
             st.download_button(
                 label="📥 Download Batch Results",
-                data=json.dumps(results, indent=2),
+                data=data,
                 file_name=f"batch_{batch_operation.lower().replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
                 mime="application/json"
             )